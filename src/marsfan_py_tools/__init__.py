@@ -3,6 +3,13 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at https: //mozilla.org/MPL/2.0/.
-"""Package base file."""
+"""Package base file.
+
+The tools in this package spend their time waiting on subprocesses and
+parsing small amounts of text, not in numeric loops, so compiled
+extensions such as Numba or Cython are intentionally not used. Parsing
+relies on module level compiled :py:mod:`re` patterns and, for JSON,
+msgspec when it is installed.
+"""
 
 __version__ = "0.0.1"
@@ -2,9 +2,14 @@
 # -*- coding: UTF-8 -*-
 """Compact all VirtualBox disk images and report results."""
 import os
+import re
 import subprocess
 import sys
-from typing import overload, Literal, Iterator
+import threading
+from argparse import ArgumentParser, ArgumentTypeError, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Iterator
 
 from pathlib import Path
 
@@ -13,78 +18,120 @@ if sys.platform != "win32":
 
 HOMEDIR = Path(os.environ["USERPROFILE"])
 PROGRAM = Path("C:/Program Files/Oracle/VirtualBox/VBoxManage.exe")
+if not PROGRAM.is_file():
+    raise RuntimeError(f"VBoxManage not found: {PROGRAM}")
+_PROGRAM_STR = os.fspath(PROGRAM)
 VBOX_DIR = HOMEDIR / "VirtualBox VMs"
+DEFAULT_JOBS = 4
+JOBS_ENV_VAR = "MARSFAN_COMPACT_JOBS"
 
+_STDOUT_LOCK = threading.Lock()
+"""Lock held while writing disk reports and errors from worker threads."""
 
-@overload
-def run_manage_command(args: list[str | Path], capture: Literal[False]) -> None:
-    ...
+_VDI_RE = re.compile(
+    r"^Location:\s*(?P<loc>.+?)\r?\n(?:[^\r\n]+\r?\n)*?^Storage format:\s*VDI\r?$",
+    re.MULTILINE
+)
+"""Regex for extracting the location of each VDI disk.
 
+Expects the output of ``VBoxManage list hdds``. Lines between fields
+must be non-empty so that a match can not span the blank line
+separating two disks.
 
-@overload
-def run_manage_command(args: list[str | Path], capture: Literal[True]) -> str:
-    ...
+Tolerates both ``\\n`` and ``\\r\\n`` line endings.
+"""
 
+_OTHER_DISK_RE = re.compile(
+    r"^Location:\s*(?P<loc>.+?)\r?\n(?:[^\r\n]+\r?\n)*?^Storage format:(?!\s*VDI\r?$)",
+    re.MULTILINE
+)
+"""Regex for extracting the location of each non-VDI disk."""
 
-def run_manage_command(args: list[str | Path], capture: bool) -> str | None:
-    """Run VBoxManage command.
+
+class ArgNamespace(Namespace):
+    """Argument namespace. Helps with type hinting."""
+
+    verbose: bool = False
+    """Whether or not to report disks that are skipped."""
+
+    jobs: int
+    """Maximum number of drives to compact disks on at the same time.
+
+    Not given a class level default, so that argparse fills in the
+    default taken from the environment.
+    """
+
+
+def vbox_run(args: list[str | Path], quiet: bool = False) -> None:
+    """Run VBoxManage command, letting output go to the console.
 
     Arguments:
         args: List of command line arguments to pass to the program.
-        capture: Whether or not to capture command line output from
-            the program.
+        quiet: If true, capture the program's standard error, where
+            VBoxManage writes its progress indicator, and only print it
+            if the command fails.
 
-    Returns:
-        None if capture is False, otherwise the command's standard
-        output as a string.
     """
     try:
-        result = subprocess.run(
-            [PROGRAM, *args],
-            capture_output=capture,
-
+        subprocess.run(
+            [_PROGRAM_STR, *args],
             check=True,
-            shell=False
+            shell=False,
+            stdin=subprocess.DEVNULL,
+            stderr=subprocess.PIPE if quiet else None,
+            encoding="utf-8",
+            errors="replace"
         )
     except subprocess.CalledProcessError as exc:
-        if capture:
-            print(exc.stderr.decode("utf-8"), sys.stderr)
+        if quiet:
+            with _STDOUT_LOCK:
+                sys.stderr.write(exc.stderr)
+                sys.stderr.flush()
         raise
 
-    if capture:
-        return result.stdout.decode("UTF-8").replace("\r\n", "\n")
-    return None
-
 
-def split_colon_line(line: str) -> tuple[str, str]:
-    """Splits a colon separated line into the left and right elements
+def vbox_capture(args: list[str | Path]) -> str:
+    """Run VBoxManage command and capture its output.
 
     Arguments:
-        line: The line to split
+        args: List of command line arguments to pass to the program.
 
     Returns:
-        Tuple of the stripped left and right sides of the colon.
+        The command's standard output as a string.
 
     """
-    key, _, value = line.partition(":")
-    return (key.strip(), value.strip())
+    try:
+        result = subprocess.run(
+            [_PROGRAM_STR, *args],
+            capture_output=True,
+            check=True,
+            shell=False,
+            stdin=subprocess.DEVNULL,
+            encoding="utf-8",
+            errors="replace"
+        )
+    except subprocess.CalledProcessError as exc:
+        print(exc.stderr, file=sys.stderr)
+        raise
+    return result.stdout
 
 
-def get_disks() -> Iterator[tuple[Path, str]]:
-    """Get a dictionary of all disks known to virtualbox.
+def get_disks(verbose: bool = False) -> Iterator[Path]:
+    """Get all VDI disks known to virtualbox.
+
+    Arguments:
+        verbose: If true, print out the location of each disk that is
+            skipped because it is not in the VDI format.
 
     Yields:
-       Tuples of information about each disk. The first element of the
-       tuple is the path to the disk, and the second element is the
-       format of the disk.
+       The path to each VDI disk.
     """
-    disk_str = run_manage_command(["list", "hdds"], True)
-    chunks = disk_str.strip().split("\n\n")
-
-    for chunk in chunks:
-        lines = chunk.splitlines()
-        info_dict = dict(split_colon_line(line) for line in lines)
-        yield Path(info_dict["Location"]), info_dict["Storage format"]
+    disk_str = vbox_capture(["list", "hdds"])
+    if verbose:
+        for match in _OTHER_DISK_RE.finditer(disk_str):
+            print(f"Skipping non-VDI disk {match['loc'].rstrip()}")
+    for match in _VDI_RE.finditer(disk_str):
+        yield Path(match["loc"].rstrip())
 
 
 def human_size(orig_value: int) -> str:
@@ -97,45 +144,117 @@ def human_size(orig_value: int) -> str:
         Human readable string of the size.
 
     """
-    val_strs = ["B", "KiB", "MiB", "GiB", "TiB"]
-    new_value = float(orig_value)
-    val_id = 0
-    while new_value > 1024 and val_id < len(val_strs) - 1:
-        new_value /= 1024
-        val_id += 1
+    if orig_value <= 0:
+        return "0.00B"
+    val_strs = ("B", "KiB", "MiB", "GiB", "TiB")
+    # Each unit is 2^10 times larger than the last, so the unit index
+    # can be taken directly from the bit length of the value.
+    val_id = min((orig_value.bit_length() - 1) // 10, len(val_strs) - 1)
+    return f"{orig_value / (1 << (10 * val_id)):.2f}{val_strs[val_id]}"
 
-    return f"{new_value:.2f}{val_strs[val_id]}"
 
-
-def compact_disk(location: Path) -> None:
+def compact_disk(location: Path, quiet: bool = False) -> None:
     """Compact a single VDI disk.
 
+    A heading is written before compacting starts, and a summary once
+    it finishes. Each is a single locked write that names the disk, so
+    output from disks compacted in parallel stays readable.
+
     Warning:
         This will fail if trying to compact a disk that is not
         in the VDI format.__annotations__
 
     Arguments:
         location: The path to the disk to compact
+        quiet: If true, hide the progress output of VBoxManage.
 
     """
     orig_size = location.stat().st_size
-    print(f"Compacting {location}")
-    run_manage_command(["modifymedium", "--compact", location], False)
+    with _STDOUT_LOCK:
+        sys.stdout.write(f"Compacting {location}\n")
+        sys.stdout.flush()
+    vbox_run(["modifymedium", "--compact", location], quiet)
     new_size = location.stat().st_size
-    print(f"\tOriginal Size       : {human_size(orig_size)}")
-    print(f"\tNew Size            : {human_size(new_size)}")
     percent_orig = new_size / orig_size * 100
-    print(f"\tPercent of original : {percent_orig:.2f}%")
+    with _STDOUT_LOCK:
+        sys.stdout.write(
+            f"Compacted {location}\n"
+            f"\tOriginal Size       : {human_size(orig_size)}\n"
+            f"\tNew Size            : {human_size(new_size)}\n"
+            f"\tPercent of original : {percent_orig:.2f}%\n"
+        )
+        sys.stdout.flush()
+
+
+def compact_drive(disks: list[Path], quiet: bool = False) -> None:
+    """Compact a group of VDI disks one after another.
+
+    Used to compact all disks on the same drive sequentially, so that
+    they do not compete with each other for the drive's bandwidth.
+
+    Arguments:
+        disks: The paths to the disks to compact.
+        quiet: If true, hide the progress output of VBoxManage.
+
+    """
+    for location in disks:
+        compact_disk(location, quiet)
+
+
+def parse_jobs(argument: str) -> int:
+    """Parse a maximum job count.
+
+    Arguments:
+        argument: The argument to parse
+
+    Returns:
+        The job count as an integer.
+
+    """
+    try:
+        jobs = int(argument)
+    except ValueError:
+        raise ArgumentTypeError(f"Job count must be an integer, got {argument!r}") from None
+    if jobs < 1:
+        raise ArgumentTypeError(f"Job count must be at least 1, got {jobs}")
+    return jobs
 
 
 def main() -> None:
     """Compact all VirtualBox disks and report results."""
-
-    for path, disk_type in get_disks():
-        if disk_type != "VDI":
-            print(f"Skipping non-VDI disk {path}")
-            continue
-        compact_disk(path)
+    parser = ArgumentParser(description="Compact all VirtualBox VDI disks.")
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Report disks that are skipped because they are not VDI disks."
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=parse_jobs,
+        # String defaults are passed through parse_jobs by argparse, so
+        # the environment variable is validated the same way as --jobs.
+        default=os.environ.get(JOBS_ENV_VAR, str(DEFAULT_JOBS)),
+        help=f"Maximum number of drives to compact disks on at the same time. Defaults to ${JOBS_ENV_VAR}, or {DEFAULT_JOBS} if that is not set."
+    )
+    args = parser.parse_args(namespace=ArgNamespace())
+
+    # Disks on the same drive are compacted sequentially, while
+    # different drives are compacted in parallel.
+    drives: dict[str, list[Path]] = {}
+    for path in get_disks(args.verbose):
+        drives.setdefault(path.drive, []).append(path)
+    if not drives:
+        return
+
+    workers = min(args.jobs, len(drives))
+    # Progress output from several VBoxManage processes at once would
+    # be mixed together on the console, so only show it for one worker.
+    compact = partial(compact_drive, quiet=workers > 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # Consume the results so that exceptions from workers are raised
+        list(executor.map(compact, drives.values()))
 
 
 if __name__ == "__main__":
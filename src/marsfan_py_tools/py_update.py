@@ -14,12 +14,35 @@ version to use.
 from collections.abc import Iterable
 import subprocess
 import re
+import shutil
 from argparse import ArgumentParser, ArgumentTypeError, Namespace
 import sys
 import json
+from operator import itemgetter
+from typing import TYPE_CHECKING
+
+try:
+    import msgspec
+except ImportError:
+    _HAS_MSGSPEC = False
+else:
+    _HAS_MSGSPEC = True
 
 # TODO: Argument to just print out updated
-# TODO:use pip's --report option with --dry-run to list all upgrades (even eager)
+
+
+_PYTHON_NAME = "py" if sys.platform == "win32" else "python3"
+_PYTHON = shutil.which(_PYTHON_NAME) or _PYTHON_NAME
+"""Python interpreter (or launcher on Windows) used to run pip.
+
+Resolved once on import to avoid searching the PATH on every pip call.
+"""
+
+_VERSION_FLAG_RE = re.compile(r"-(\d(?:\.\d+)?)")
+"""Regex matching the ``-A.B`` version syntax of the Python launcher."""
+
+_NAME_SEPARATOR_RE = re.compile(r"[-_.]+")
+"""Regex matching the separators that are equivalent in package names."""
 
 
 class ArgNamespace(Namespace):
@@ -44,8 +67,33 @@ class ArgNamespace(Namespace):
     yes: bool = False
     """Don't ask for confirmation prior to starting package upgrade."""
 
+    dry_run: bool = False
+    """Only report what would be upgraded, without installing anything."""
+
+
+if TYPE_CHECKING or _HAS_MSGSPEC:
+    class _Package(msgspec.Struct):
+        """Entry in the output of ``pip list --format=json``."""
+
+        name: str
+
+    class _ReportMetadata(msgspec.Struct):
+        """Metadata of a package in a pip installation report."""
+
+        name: str
+
+    class _ReportItem(msgspec.Struct):
+        """Package that would be installed in a pip installation report."""
+
+        metadata: _ReportMetadata
 
-def run_pip_command(version: str | None, args: Iterable[str], capture_output: bool) -> str:
+    class _Report(msgspec.Struct):
+        """Installation report produced by ``pip install --report``."""
+
+        install: list[_ReportItem]
+
+
+def run_pip_command(version: str | None, args: Iterable[str], capture_output: bool) -> bytes:
     """Run a pip command, and return standard output.
 
     Arguments:
@@ -58,16 +106,14 @@ def run_pip_command(version: str | None, args: Iterable[str], capture_output: bo
             command and return it.
 
     Returns:
-        The standard output from running the command if capture_output
-        is True, otherwise returns an empty string.
+        The raw standard output from running the command if
+        capture_output is True, otherwise returns an empty bytes object.
 
     """
     if sys.platform == "win32" and version:
-        command = ["py", version, "-m", "pip"]
-    elif sys.platform == "win32":
-        command = ["py", "-m", "pip"]
+        command = [_PYTHON, version, "-m", "pip"]
     else:
-        command = ["python3", "-m", "pip"]
+        command = [_PYTHON, "-m", "pip"]
     command.extend(args)
     result = subprocess.run(
         command,
@@ -77,9 +123,9 @@ def run_pip_command(version: str | None, args: Iterable[str], capture_output: bo
     )
 
     if capture_output:
-        return result.stdout.decode("UTF-8")
+        return result.stdout
     else:
-        return ""
+        return b""
 
 
 def parse_version_flag(argument: str) -> str:
@@ -92,56 +138,124 @@ def parse_version_flag(argument: str) -> str:
         Value of the parsed argument
 
     """
-    result = re.fullmatch(r"-(\d(\.\d+)?)", argument)
-    if not result:
+    if not _VERSION_FLAG_RE.fullmatch(argument):
         raise ArgumentTypeError("Invalid Python version string")
     return argument
 
 
-def get_outdated(version: str | None, not_required: bool) -> list[str]:
+def parse_package_list(data: bytes) -> list[str]:
+    """Get the package names from the JSON output of ``pip list``.
+
+    Uses msgspec for decoding if it is installed, otherwise falls back
+    to the standard library JSON decoder.
+
+    Arguments:
+        data: JSON output of ``pip list --format=json``.
+
+    Returns:
+        List of package names.
+
+    """
+    if _HAS_MSGSPEC:
+        return [pkg.name for pkg in msgspec.json.decode(data, type=list[_Package])]
+    return list(map(itemgetter("name"), json.loads(data)))
+
+
+def parse_install_report(data: bytes) -> list[str]:
+    """Get the names of packages that would be installed from a pip report.
+
+    Uses msgspec for decoding if it is installed, otherwise falls back
+    to the standard library JSON decoder.
+
+    Arguments:
+        data: JSON installation report from ``pip install --report``.
+
+    Returns:
+        List of package names.
+
+    """
+    if _HAS_MSGSPEC:
+        report = msgspec.json.decode(data, type=_Report)
+        return [pkg.metadata.name for pkg in report.install]
+    return [pkg["metadata"]["name"] for pkg in json.loads(data)["install"]]
+
+
+def normalize_name(name: str) -> str:
+    """Normalize a package name so that equivalent names compare equal.
+
+    Arguments:
+        name: The package name to normalize.
+
+    Returns:
+        The lowercase name with runs of ``-``, ``_``, and ``.`` replaced
+        by a single ``-``.
+
+    """
+    return _NAME_SEPARATOR_RE.sub("-", name).lower()
+
+
+def get_outdated(version: str | None, not_required: bool, eager: bool) -> list[str]:
     """Get a list of packages that are outdated.
 
+    The installed packages are listed locally, then a single dry-run
+    install is used to resolve which of them (and, when upgrading
+    eagerly, which of their dependencies) would be upgraded. New
+    dependencies that the upgrade would install are not included.
+
     Arguments:
         version: Python version to use for upgrading. If :py:type:`None`,
             default Python version will be used. This has no affect on
             non-Windows platforms, where the default version is always
             used
+        not_required: If true, only consider packages that are not
+            dependencies of other packages.
+        eager: If true, also report dependencies that would be upgraded
+            by the eager upgrade strategy.
 
 
     Returns:
         List of outdated packages.
 
     """
-    pip_args = ["list", "--outdated", "--format=json"]
+    list_args = ["list", "--format=json"]
+    installed = parse_package_list(run_pip_command(version, list_args, True))
     if not_required:
-        pip_args.append("--not-required")
-    command_out = run_pip_command(version, pip_args, True)
-    return [pkg["name"] for pkg in json.loads(command_out)]
+        list_args.append("--not-required")
+        requested = parse_package_list(run_pip_command(version, list_args, True))
+    else:
+        requested = installed
+    if not requested:
+        return []
+
+    report_args = ["install", "-U", "--dry-run", "--report", "-", "--quiet"]
+    if eager:
+        report_args.append("--upgrade-strategy=eager")
+    report_args.extend(requested)
+    installed_names = {normalize_name(name) for name in installed}
+    return [
+        name
+        for name in parse_install_report(run_pip_command(version, report_args, True))
+        if normalize_name(name) in installed_names
+    ]
 
 
-def confirm_upgrade(packages: list[str], eager_warning: bool) -> bool:
+def confirm_upgrade(packages: list[str]) -> bool:
     """Print out package upgrade list, and confirm upgrade from user.
 
     Arguments:
         packages: List of packages to upgrade.
-        eager_warning: If True, also prints out a warning that eager upgrading
-            of dependencies will also be performed.
 
     """
-    print("The following packages are found to be outdated:")
-
-    for package in packages:
-        print(f"\t{package}")
-
-    print("")
-    if eager_warning:
-        print(
-            "WARNING: Eager flag supplied. Additional packages beyond these will be upgraded"
-        )
+    sys.stdout.write(
+        "The following packages are found to be outdated:\n\t"
+        + "\n\t".join(packages)
+        + "\n\n"
+    )
+    sys.stdout.flush()
     return input("Proceed (Y/n)? ").lower() == "y"
 
 
-def upgrade_packages(version: str | None, packages: list[str], eager: bool) -> None:
+def upgrade_packages(version: str | None, packages: list[str], eager: bool, dry_run: bool) -> None:
     """Upgrade the specified packages.
 
     Arguments:
@@ -152,9 +266,13 @@ def upgrade_packages(version: str | None, packages: list[str], eager: bool) -> N
         packages: List of packages to upgrade.
         eager: If true, use eager upgrade strategy, which upgrades all
             dependencies as well.
+        dry_run: If true, pass ``--dry-run`` to pip so that nothing is
+            actually installed.
 
     """
-    command = ["install", "-U", "--dry-run"]
+    command = ["install", "-U", "--no-input", "--disable-pip-version-check"]
+    if dry_run:
+        command.append("--dry-run")
     if eager:
         command.append("--upgrade-strategy=eager")
     command.extend(packages)
@@ -190,14 +308,21 @@ def main() -> None:
         action="store_true",
         help="Don't ask for confirmation prior to upgrading packages."
     )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Don't actually upgrade anything, just report what would be done."
+    )
 
     args = parser.parse_args(namespace=ArgNamespace())
 
     if sys.platform == "win32" and args.version == "-0":
         subprocess.run(["pya", "-0"], check=False, shell=False)
     else:
-        outdated = get_outdated(args.version, args.not_required)
-        if confirm_upgrade(outdated, args.eager and args.not_required) or args.yes:
-            upgrade_packages(args.version, outdated, args.eager)
+        outdated = get_outdated(args.version, args.not_required, args.eager)
+        if not outdated:
+            print("No outdated packages")
+        elif args.dry_run or confirm_upgrade(outdated) or args.yes:
+            upgrade_packages(args.version, outdated, args.eager, args.dry_run)
         else:
             print("Upgrade cancelled")